@@ -1,49 +1,127 @@
 import json
+import warnings
+from collections import Counter, defaultdict
+from operator import itemgetter
+from types import MappingProxyType
 import numpy as np
-import matplotlib.pyplot as plt
-from sklearn.preprocessing import MinMaxScaler
-from scipy.optimize import minimize
-from adjustText import adjust_text
-import random
+from numpy.lib.recfunctions import structured_to_unstructured
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖，缺失时回退到标准库 json
+    orjson = None
+
+
+def _json_loads(data):
+    """解析JSON字节串，优先使用 orjson"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+# 食材条目数达到该值时才尝试使用 numba 内核；小菜单下 JIT 编译开销远大于 np.bincount
+_NUMBA_MIN_SIZE = 1_000_000
+_numba_aggregate = None
+
+
+def _aggregate_loop(healths, pops, inv, n_groups):
+    """按分组下标单次遍历累计健康值之和、喜爱度之和及计数（numba 编译用）"""
+    sum_h = np.zeros(n_groups)
+    sum_p = np.zeros(n_groups)
+    counts = np.zeros(n_groups, dtype=np.int64)
+    for i in range(inv.shape[0]):
+        g = inv[i]
+        sum_h[g] += healths[i]
+        sum_p[g] += pops[i]
+        counts[g] += 1
+    return sum_h, sum_p, counts
+
+
+def _get_numba_aggregate():
+    """首次使用时导入 numba 并编译内核；numba 为可选依赖，缺失时返回 None"""
+    global _numba_aggregate
+    if _numba_aggregate is None:
+        try:
+            import numba
+        except ImportError:
+            _numba_aggregate = False
+        else:
+            _numba_aggregate = numba.njit(cache=True)(_aggregate_loop)
+    return _numba_aggregate or None
+
+
+def _aggregate(healths, pops, inv, n_groups):
+    """按分组下标累计健康值之和、喜爱度之和及计数"""
+    if len(inv) >= _NUMBA_MIN_SIZE:
+        kernel = _get_numba_aggregate()
+        if kernel is not None:
+            return kernel(healths, pops, inv, n_groups)
+    return (np.bincount(inv, weights=healths, minlength=n_groups),
+            np.bincount(inv, weights=pops, minlength=n_groups),
+            np.bincount(inv, minlength=n_groups))
+
+def _make_cd_ndi(keys, weights):
+    """生成绑定了字段名与权重的CD-NDI标量计算方法（权重作为闭包常量，每次调用无需属性查找）"""
+    get_nutrients = itemgetter(*keys)
+    w_protein, w_fiber, w_sat_fat, w_sodium, w_sugar = weights
 
-class DietNutritionAnalyzer:
-    def __init__(self, dishes_data):
-        self.dishes = dishes_data['dishes']
-        self.calculate_dish_scores()
-    
     def calculate_cd_ndi(self, nutrition_dict):
         """计算CD-NDI营养质量指标"""
-        protein = nutrition_dict['protein']
-        fiber = nutrition_dict['dietaryFiber']
-        sat_fat = nutrition_dict['saturatedFat']
-        sodium = nutrition_dict['sodium']
-        added_sugar = nutrition_dict['addedSugar']
+        protein, fiber, sat_fat, sodium, added_sugar = get_nutrients(nutrition_dict)
         
-        cd_ndi = (protein * 2.5 + fiber * 1.8) - (sat_fat * 3.5 + sodium * 0.01 + added_sugar * 2.5)
+        cd_ndi = (protein * w_protein + fiber * w_fiber + sat_fat * w_sat_fat
+                  + sodium * w_sodium + added_sugar * w_sugar)
 
         return cd_ndi
+
+    return calculate_cd_ndi
+
+class DietNutritionAnalyzer:
+    # CD-NDI 各营养素字段及对应权重
+    _NUTRIENT_KEYS = ('protein', 'dietaryFiber', 'saturatedFat', 'sodium', 'addedSugar')
+    # 菜品结构化数组：各营养素字段（与 _NUTRIENT_KEYS 一一对应）+ 喜爱度
+    _NUTRIENT_FIELDS = ('protein', 'fiber', 'satfat', 'sodium', 'sugar')
+    _DISH_DTYPE = np.dtype([(field, 'f8') for field in _NUTRIENT_FIELDS] + [('pop', 'f8')])
+    _W = (2.5, 1.8, -3.5, -0.01, -2.5)
+    _CD_NDI_WEIGHTS = np.array(_W)
+
+    # 类别 -> “主料”替换后的具体食材名称
+    _CATEGORY_REPLACEMENTS = MappingProxyType({
+        "猪肉类": "猪肉",
+        "鸡肉类": "鸡肉",
+        "牛肉类": "牛肉",
+        "羊肉类": "羊肉",
+        "水产类": "鱼肉",
+        "蔬菜类": "青菜",
+        "豆制品类": "豆腐",
+        "汤品类": "汤底",
+        "主食类": "米饭",
+        "饮品": "饮品基底",
+        "小吃油炸": "油炸制品",
+        "西式快餐": "鸡排",
+        "台式便当": "便当主料",
+        "风味快餐": "烤肉",
+        "西式简餐": "芝士",
+    })
+
+    def __init__(self, dishes_data):
+        self.dishes = dishes_data['dishes']
+        self._ingredients_normalized = False
+        self.calculate_dish_scores()
+    
+    def _load_arrays(self):
+        """从菜品字典重建结构化数组（分析只基于该数组，菜品字典仅用于展示）"""
+        self._arr = np.zeros(len(self.dishes), dtype=self._DISH_DTYPE)
+        for key, field in zip(self._NUTRIENT_KEYS, self._NUTRIENT_FIELDS):
+            self._arr[field] = [dish['total_nutrition'][key] for dish in self.dishes]
+        self._arr['pop'] = [dish['popularity_score'] for dish in self.dishes]
+        # 营养素字段的 (N, 5) 视图（不复制数据），用于矩阵向量乘
+        self._nut = structured_to_unstructured(self._arr[list(self._NUTRIENT_FIELDS)])
+    
+    # 与批量路径共用同一组权重 _W，避免两处定义不一致
+    calculate_cd_ndi = _make_cd_ndi(_NUTRIENT_KEYS, _W)
     
     def _replace_main_ingredient_name(self, dish):
         """将主料自动替换成具体食材名称"""
-        cat = dish.get('category', '')
-        replacements = {
-            "猪肉类": "猪肉",
-            "鸡肉类": "鸡肉",
-            "牛肉类": "牛肉",
-            "羊肉类": "羊肉",
-            "水产类": "鱼肉",
-            "蔬菜类": "青菜",
-            "豆制品类": "豆腐",
-            "汤品类": "汤底",
-            "主食类": "米饭",
-            "饮品": "饮品基底",
-            "小吃油炸": "油炸制品",
-            "西式快餐": "鸡排",
-            "台式便当": "便当主料",
-            "风味快餐": "烤肉",
-            "西式简餐": "芝士",
-        }
-        default_name = replacements.get(cat, "未知食材")
+        default_name = self._CATEGORY_REPLACEMENTS.get(dish.get('category', ''), "未知食材")
         
         # 遍历 ingredients
         for ing in dish.get('ingredients', []):
@@ -51,67 +129,138 @@ class DietNutritionAnalyzer:
                 ing['name'] = default_name
     
     def calculate_dish_scores(self):
-        """为每个菜品计算营养得分和综合得分"""
-        for dish in self.dishes:
-            # 计算CD-NDI
-            dish['cd_ndi'] = self.calculate_cd_ndi(dish['total_nutrition'])
-            
-            # 标准化营养得分和喜爱度得分（0-1范围）
-            scaler = MinMaxScaler()
-            
-            # 营养得分（CD-NDI越高越好）
-            nutrition_score = dish['cd_ndi']
-            
-            # 喜爱度得分
-            popularity_score = dish['popularity_score']
-            
-            dish['nutrition_score'] = nutrition_score
-            dish['normalized_popularity'] = popularity_score / 10.0  # 标准化到0-1
-            
-            # 综合匹配度得分（平衡营养和喜爱度）
-            # 权重可调整：0.6营养 + 0.4喜爱度
-            dish['match_score'] = 0.6 * (nutrition_score / 100) + 0.4 * dish['normalized_popularity']
+        """为每个菜品计算营养得分和综合得分（菜品数据修改后可重新调用）"""
+        self._load_arrays()
+        
+        # 营养得分（CD-NDI越高越好）
+        nutrition_scores = self._nut @ self._CD_NDI_WEIGHTS
+        
+        # 喜爱度得分，标准化到0-1
+        popularity_scores = self._arr['pop']
+        normalized_popularity = popularity_scores / 10.0
+        
+        # 综合匹配度得分（平衡营养和喜爱度）
+        # 权重可调整：0.6营养 + 0.4喜爱度
+        match_scores = np.add(np.multiply(0.6, nutrition_scores / 100),
+                              np.multiply(0.4, normalized_popularity))
+        
+        for dish, cd_ndi, norm_pop, match in zip(self.dishes, nutrition_scores.tolist(),
+                                                 normalized_popularity.tolist(),
+                                                 match_scores.tolist()):
+            dish['cd_ndi'] = cd_ndi
+            dish['nutrition_score'] = cd_ndi
+            dish['normalized_popularity'] = norm_pop
+            dish['match_score'] = match
+        
+        # 缓存菜品级数组，供后续各分析方法直接复用
+        self._nutrition_arr = nutrition_scores
+        self._pop_arr = popularity_scores
+        self._match_arr = match_scores
+        self._names = [dish['name'] for dish in self.dishes]
+    
+    def _top_k_indices(self, values, k):
+        """返回数组中最大的k个元素下标（从大到小，并列时按原顺序）"""
+        k = min(k, len(values))
+        if k == 0:
+            return np.empty(0, dtype=np.intp)
+        # 取出不小于第k大值的全部候选（含并列），按下标顺序稳定排序，
+        # 使并列时与 sorted(..., reverse=True) 一样保持菜品原有顺序
+        kth = np.partition(values, -k)[-k]
+        idx = np.flatnonzero(values >= kth)
+        return idx[np.argsort(-values[idx], kind='stable')][:k]
     
     def analyze_correlation(self):
         """分析营养得分与喜爱度的相关性"""
-        nutrition_scores = [dish['nutrition_score'] for dish in self.dishes]
-        popularity_scores = [dish['popularity_score'] for dish in self.dishes]
+        x = self._nutrition_arr
+        y = self._pop_arr
         
-        correlation = np.corrcoef(nutrition_scores, popularity_scores)[0, 1]
+        # 两向量Pearson相关系数，避免np.corrcoef构造完整协方差矩阵
+        xd = x - x.mean()
+        yd = y - y.mean()
+        correlation = xd.dot(yd) / np.sqrt(xd.dot(xd) * yd.dot(yd))
         return correlation
     
-    def find_optimal_combination(self, daily_calorie_limit=2000):
-        """找到最优菜品组合（营养与喜爱度的平衡）"""
-        # 简化版：选择前N个菜品使得总匹配度最高
-        dishes_sorted = sorted(self.dishes, key=lambda x: x['match_score'], reverse=True)
+    def find_optimal_combination(self, daily_calorie_limit=2000, max_dishes=5, calories=None):
+        """
+        找到最优菜品组合（营养与喜爱度的平衡）
+        
+        以0-1整数规划求解：在总热量不超过 daily_calorie_limit、
+        菜品数不超过 max_dishes 的约束下，使总匹配度最高
+        
+        Parameters:
+        calories: 各菜品热量(kcal)，缺省时读取 total_nutrition 中的 'calories' 字段；
+                  没有热量数据时忽略热量约束并给出警告
+        """
+        # 求解器只在需要时导入，避免拖慢报告生成等路径的启动
+        from scipy.optimize import milp, LinearConstraint, Bounds
+        
+        match_scores = self._match_arr
+        if not len(match_scores):
+            return []
+        
+        if calories is None and all('calories' in dish['total_nutrition'] for dish in self.dishes):
+            calories = [dish['total_nutrition']['calories'] for dish in self.dishes]
         
-        # 模拟选择（实际应用可扩展为线性规划）
-        selected_dishes = dishes_sorted[:5]  # 选择前5个最高匹配度菜品
+        rows, ub = [np.ones_like(match_scores)], [max_dishes]
+        if daily_calorie_limit is not None:
+            if calories is None:
+                warnings.warn("菜品数据中没有热量(calories)字段，已忽略 daily_calorie_limit 约束")
+            else:
+                rows.append(np.asarray(calories, dtype=np.float64))
+                ub.append(daily_calorie_limit)
+        
+        constraints = LinearConstraint(np.vstack(rows), ub=ub)
+        res = milp(-match_scores, constraints=constraints,
+                   integrality=np.ones_like(match_scores), bounds=Bounds(0, 1))
+        if not res.success:
+            raise RuntimeError(f"菜品组合求解失败（status={res.status}）: {res.message}")
+        
+        # 按匹配度从高到低输出选中的菜品
+        selected = np.flatnonzero(res.x > 0.5)
+        selected = selected[np.argsort(-match_scores[selected], kind='stable')]
+        selected_dishes = [self.dishes[i] for i in selected]
         
         return selected_dishes
     
     def analyze_ingredient_frequency(self):
         """分析主料使用频率"""
-        ingredient_count = {}
-        for dish in self.dishes:
-            for ing in dish['ingredients']:
-                name = ing['name']
-                ingredient_count[name] = ingredient_count.get(name, 0) + 1
-        
         # 按频率排序
-        sorted_ingredients = sorted(ingredient_count.items(), key=lambda x: x[1], reverse=True)
-        return sorted_ingredients
+        return Counter(ing['name'] for dish in self.dishes for ing in dish['ingredients']).most_common()
     
-    def visualize_analysis_optimized(self, aggregation_method='average'):
+    def _merge_labels(self, xs, ys, names):
+        """合并坐标（保留两位小数）重合的标签，文本以“/”连接"""
+        merged = {}
+        for x, y, name in zip(xs, ys, names):
+            key = (round(float(x), 2), round(float(y), 2))
+            if key in merged:
+                merged[key][2].append(str(name))
+            else:
+                merged[key] = (x, y, [str(name)])
+        return [(x, y, '/'.join(label_names)) for x, y, label_names in merged.values()]
+    
+    def visualize_analysis_optimized(self, aggregation_method='average',
+                                     max_iter=200, precision=0.1, max_adjust_labels=300):
         """
         优化版可视化分析
         
         Parameters:
         aggregation_method: 'average'（平均值）或 'frequency'（带频率）
+        max_iter: adjust_text 最大迭代次数
+        precision: adjust_text 收敛精度
+        max_adjust_labels: 标签数超过该值时跳过自动避让
         """
-        # 处理主料名称
-        for dish in self.dishes:
-            self._replace_main_ingredient_name(dish)
+        # 绘图依赖只在可视化时导入，避免拖慢报告生成等非绘图路径
+        import matplotlib.pyplot as plt
+        import matplotlib.colors as mcolors
+        from matplotlib.font_manager import FontProperties
+        from matplotlib.lines import Line2D
+        from adjustText import adjust_text
+        
+        # 处理主料名称（替换是幂等的，只需执行一次）
+        if not self._ingredients_normalized:
+            for dish in self.dishes:
+                self._replace_main_ingredient_name(dish)
+            self._ingredients_normalized = True
         
         plt.rcParams['font.sans-serif'] = ['SimHei']
         plt.rcParams['axes.unicode_minus'] = False
@@ -120,96 +269,92 @@ class DietNutritionAnalyzer:
         texts = []
 
         # === 食材数据聚合 ===
-        ingredient_stats = {}
+        # 所有食材营养一次性堆叠，单次矩阵向量乘计算CD-NDI
+        all_ings = [(ing, dish['popularity_score'])
+                    for dish in self.dishes for ing in dish.get('ingredients', [])]
+        keys = self._NUTRIENT_KEYS
+        ing_nut = np.fromiter((ing[k] for ing, _ in all_ings for k in keys),
+                              dtype=np.float64, count=len(all_ings) * len(keys))
+        healths = ing_nut.reshape(-1, len(keys)) @ self._CD_NDI_WEIGHTS
         
-        for dish in self.dishes:
-            for ing in dish.get('ingredients', []):
-                name = ing['name']
-                health = self.calculate_cd_ndi(ing)
-                pop = dish['popularity_score']
-                
-                if name not in ingredient_stats:
-                    ingredient_stats[name] = {'healths': [], 'pops': []}
-                ingredient_stats[name]['healths'].append(health)
-                ingredient_stats[name]['pops'].append(pop)
+        names = [ing['name'] for ing, _ in all_ings]
+        pops = np.fromiter((pop for _, pop in all_ings), dtype=np.float64, count=len(all_ings))
+        
+        # 按食材名称分组求和，再除以出现次数得到平均值
+        ingredient_names, inv = np.unique(names, return_inverse=True)
+        sum_health, sum_pop, counts = _aggregate(healths, pops, inv.astype(np.intp),
+                                                 len(ingredient_names))
+        ingredient_health = sum_health / counts
+        ingredient_pop = sum_pop / counts
         
         # 根据聚合方法处理数据
         if aggregation_method == 'average':
             # 平均值聚合
-            ingredient_health = []
-            ingredient_pop = []
-            ingredient_names = []
-            
-            for name, stats in ingredient_stats.items():
-                avg_health = np.mean(stats['healths'])
-                avg_pop = np.mean(stats['pops'])
-                
-                ingredient_health.append(avg_health)
-                ingredient_pop.append(avg_pop)
-                ingredient_names.append(name)
-            
-            # 绘制食材点
-            ax.scatter(ingredient_health, ingredient_pop, 
-                       s=35, c='limegreen', alpha=0.7, label='原材料')
+            ingredient_sizes = np.full(len(ingredient_names), 35.0)
+            ingredient_label = '原材料'
         
         elif aggregation_method == 'frequency':
             # 频率加权聚合
-            ingredient_health = []
-            ingredient_pop = []
-            ingredient_names = []
-            sizes = []
-            
-            for name, stats in ingredient_stats.items():
-                avg_health = np.mean(stats['healths'])
-                avg_pop = np.mean(stats['pops'])
-                frequency = len(stats['healths'])
-                
-                ingredient_health.append(avg_health)
-                ingredient_pop.append(avg_pop)
-                ingredient_names.append(name)
-                sizes.append(30 + frequency * 8)  # 大小与频率成正比
-            
-            scatter = ax.scatter(ingredient_health, ingredient_pop, 
-                               s=sizes, c='limegreen', alpha=0.7, 
-                               label='原材料（点大小=使用频率）')
+            ingredient_sizes = 30 + counts * 8  # 大小与频率成正比
+            ingredient_label = '原材料（点大小=使用频率）'
+        
+        else:
+            raise ValueError(f"未知的聚合方法: {aggregation_method}")
 
         # === 菜品数据（保持不变）===
-        dish_nutrition = [dish['nutrition_score'] for dish in self.dishes]
-        dish_popularity = [dish['popularity_score'] for dish in self.dishes]
-        dish_names = [dish['name'] for dish in self.dishes]
+        dish_nutrition = self._nutrition_arr
+        dish_popularity = self._pop_arr
+        dish_names = self._names
 
-        ax.scatter(dish_nutrition, dish_popularity, s=60, c='royalblue', alpha=0.8, label='菜品')
+        # === 食材与菜品合并为一次散点绘制 ===
+        n_ing, n_dish = len(ingredient_names), len(dish_names)
+        ingredient_color = mcolors.to_rgba('limegreen', alpha=0.7)
+        dish_color = mcolors.to_rgba('royalblue', alpha=0.8)
+        ax.scatter(np.concatenate([ingredient_health, dish_nutrition]),
+                   np.concatenate([ingredient_pop, dish_popularity]),
+                   s=np.concatenate([ingredient_sizes, np.full(n_dish, 60.0)]),
+                   c=[ingredient_color] * n_ing + [dish_color] * n_dish)
+        legend_handles = [
+            Line2D([], [], marker='o', linestyle='', color=ingredient_color, label=ingredient_label),
+            Line2D([], [], marker='o', linestyle='', color=dish_color, label='菜品'),
+        ]
 
         # === 添加标签 ===
+        # 同类标签共享同一字体属性对象
+        ingredient_font = FontProperties(size=8)
+        dish_font = FontProperties(size=9, weight='bold')
+        
         # 食材标签
-        for i, name in enumerate(ingredient_names):
-            texts.append(ax.text(ingredient_health[i], ingredient_pop[i], name,
-                                fontsize=8, color='darkgreen', alpha=0.8))
+        for x, y, label in self._merge_labels(ingredient_health, ingredient_pop, ingredient_names):
+            texts.append(ax.text(x, y, label,
+                                fontproperties=ingredient_font, color='darkgreen', alpha=0.8))
         
         # 菜品标签
-        for i, name in enumerate(dish_names):
-            texts.append(ax.text(dish_nutrition[i], dish_popularity[i], name,
-                                fontsize=9, color='navy', alpha=0.9, weight='bold'))
+        for x, y, label in self._merge_labels(dish_nutrition, dish_popularity, dish_names):
+            texts.append(ax.text(x, y, label,
+                                fontproperties=dish_font, color='navy', alpha=0.9))
 
         # === 自动避让 ===
-        adjust_text(
-            texts,
-            expand_text=(1.3, 1.5),
-            expand_points=(1.3, 1.5),
-            force_text=1.2,
-            force_points=0.8,
-            arrowprops=dict(arrowstyle='-', color='gray', lw=0.4, alpha=0.6),
-            only_move={'points': 'xy', 'text': 'xy'},  # 双方向避让
-            precision=0.03,
-            max_iter=800  # 更多迭代让布局更精确
-        )
+        # 重叠检测代价随标签数平方增长，标签过多时直接使用原始位置
+        if len(texts) <= max_adjust_labels:
+            adjust_text(
+                texts,
+                expand_text=(1.3, 1.5),
+                expand_points=(1.3, 1.5),
+                force_text=1.2,
+                force_points=0.8,
+                arrowprops=dict(arrowstyle='-', color='gray', lw=0.4, alpha=0.6),
+                only_move={'points': 'xy', 'text': 'xy'},  # 双方向避让
+                precision=precision,
+                max_iter=max_iter
+            )
 
         # === 图表样式 ===
         ax.set_xlabel('健康值 (CD-NDI)', fontsize=14)
         ax.set_ylabel('喜爱度', fontsize=14)
         ax.set_title('好感度与健康度匹配分析', fontsize=16)
         ax.grid(True, alpha=0.3)
-        ax.legend(fontsize=12)
+        ax.legend(handles=legend_handles, fontsize=12)
 
         plt.tight_layout()
         plt.show()
@@ -232,16 +377,21 @@ class DietNutritionAnalyzer:
             print("建议: 需要系统性优化菜品设计")
         
         print("\n匹配度最高菜品TOP5:")
-        dishes_sorted = sorted(self.dishes, key=lambda x: x['match_score'], reverse=True)
-        for i, dish in enumerate(dishes_sorted[:5]):
+        top_dishes = [self.dishes[i] for i in self._top_k_indices(self._match_arr, 5)]
+        for i, dish in enumerate(top_dishes):
             print(f"{i+1}. {dish['name']} (匹配度: {dish['match_score']:.3f})")
         
         print("\n各类别表现分析:")
-        categories = list(set([dish['category'] for dish in self.dishes]))
-        for category in categories:
-            cat_dishes = [dish for dish in self.dishes if dish['category'] == category]
-            avg_match = np.mean([dish['match_score'] for dish in cat_dishes])
-            avg_popularity = np.mean([dish['popularity_score'] for dish in cat_dishes])
+        # 单次遍历累计各类别的 [匹配度之和, 喜爱度之和, 菜品数]
+        category_stats = defaultdict(lambda: [0.0, 0.0, 0])
+        for dish in self.dishes:
+            stats = category_stats[dish['category']]
+            stats[0] += dish['match_score']
+            stats[1] += dish['popularity_score']
+            stats[2] += 1
+        for category, (sum_match, sum_popularity, count) in category_stats.items():
+            avg_match = sum_match / count
+            avg_popularity = sum_popularity / count
             print(f"{category}: 平均匹配度{avg_match:.3f}, 平均喜爱度{avg_popularity:.1f}")
         
         # 新增：食材使用频率分析
@@ -254,8 +404,8 @@ class DietNutritionAnalyzer:
 if __name__ == "__main__":
     # 加载数据（这里直接使用上面提供的JSON数据）
     # 注意：这里需要将文档1的内容保存为datas.json文件
-    with open('datas.json', 'r', encoding='utf-8') as f:
-        dishes_data = json.load(f)
+    with open('datas.json', 'rb') as f:
+        dishes_data = _json_loads(f.read())
     
     # 创建分析器
     analyzer = DietNutritionAnalyzer(dishes_data)